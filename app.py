@@ -1,12 +1,20 @@
 import streamlit as st
-from PIL import Image
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import tempfile
+import re
+import io
+import hashlib
+import uuid
+import asyncio
+import random
+import time
+import math
+import threading
+from concurrent.futures import Future
 import cv2
 import numpy as np
-import os
 import ssl
 try:
     import streamlit.secret as secrets
@@ -75,12 +83,30 @@ elif ocr_engine == "Groq (Llama 4 Maverick)":
     if not groq_api_key:
         st.sidebar.warning("⚠️ API key required for Groq")
 
+enhance_image = st.sidebar.checkbox(
+    "Preprocess image (grayscale + threshold)",
+    value=False,
+    help="Can help with faint or noisy photos. Usually not needed: the vision models read colour photos directly and binarization may lose detail."
+)
+
+retry_blocking = st.sidebar.checkbox(
+    "Wait and retry when rate limited",
+    value=True,
+    help="Retries busy or rate-limited API calls with backoff. Turn off to fail fast and see when to try again."
+)
+
 
 # Initialize engines
+GROQ_HTTP_LIMITS = dict(max_keepalive_connections=8, max_connections=16)
+
 @st.cache_resource
 def load_groq_client(api_key):
+    import httpx
     from groq import Groq
-    return Groq(api_key=api_key)
+    # Keep-alive HTTP/2 connection pool so repeat calls skip the TLS handshake
+    http_client = httpx.Client(http2=True, limits=httpx.Limits(**GROQ_HTTP_LIMITS), timeout=60.0)
+    # call_with_retries is the only retry layer, so the non-blocking mode can fail fast
+    return Groq(api_key=api_key, http_client=http_client, max_retries=0)
 
 @st.cache_resource
 def load_gemini(_api_key):
@@ -88,19 +114,89 @@ def load_gemini(_api_key):
     genai.configure(api_key=_api_key)
     return genai.GenerativeModel('gemini-1.5-flash')
 
-def encode_image(image_path):
-    import base64
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# Turn off the Gemini SDK's own retries; call_with_retries is the only retry layer
+GEMINI_REQUEST_OPTIONS = {"retry": None}
+
+# Retry settings for 408/409/429 (RESOURCE_EXHAUSTED), 5xx and connection errors
+MAX_ATTEMPTS = 3
+BASE_BACKOFF_MS = 1000
+JITTER_FACTOR = 0.25
+
+class OCRFailedError(Exception):
+    """Raised by the sync OCR calls so failures are not cached and can be shown by the caller"""
+
+class RateLimitedError(Exception):
+    """Raised instead of sleeping when retries are non-blocking"""
+    def __init__(self, delay):
+        super().__init__(f"API is rate limited or busy, try again in {math.ceil(delay)} seconds")
+        # Epoch seconds, for anything that needs the exact time
+        self.retry_at = time.time() + delay
+
+def is_retryable(error):
+    from groq import APIConnectionError
+    # Dropped connections and timeouts (APITimeoutError is a subclass)
+    if isinstance(error, APIConnectionError):
+        return True
+    # groq exposes status_code, google.api_core exposes code
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return isinstance(status, int) and (status in (408, 409, 429) or status >= 500)
+
+def backoff_seconds(attempt):
+    delay_ms = BASE_BACKOFF_MS * 2 ** attempt
+    return (delay_ms + random.uniform(0, delay_ms * JITTER_FACTOR)) / 1000
+
+def call_with_retries(fn, blocking=True):
+    """Call fn(), retrying retryable API errors with jittered exponential backoff"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = backoff_seconds(attempt)
+            if not blocking:
+                raise RateLimitedError(delay) from e
+            time.sleep(delay)
+
+def encode_image_bytes(data: bytes) -> str:
+    import pybase64
+    return pybase64.b64encode(data).decode('ascii')
 
-def groq_ocr_process(image_path, api_key, mode="Relaxed (Clean Notes)"):
-    """Process image with Groq Llama 4 Maverick using improved system prompt"""
+@st.cache_resource
+def load_s3_client():
+    import boto3
+    return boto3.client("s3")
+
+def upload_image_for_url(image_bytes, mime_type="image/jpeg"):
+    """Upload to OCR_UPLOAD_BUCKET and return (5 minute URL, object key), or (None, None) if no bucket is set"""
+    if "OCR_UPLOAD_BUCKET" not in st.secrets:
+        return None, None
+    bucket = st.secrets["OCR_UPLOAD_BUCKET"]
+    key = f"ocr-uploads/{uuid.uuid4().hex}"
+    s3 = load_s3_client()
+    s3.put_object(Bucket=bucket, Key=key, Body=image_bytes, ContentType=mime_type)
+    url = s3.generate_presigned_url(
+        "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=300
+    )
+    return url, key
+
+def delete_uploaded_image(key):
+    # Best effort: the bucket lifecycle rule (see README) removes anything left behind
     try:
-        client = load_groq_client(api_key)
-        base64_image = encode_image(image_path)
-        
-        # Base System Prompt
-        system_prompt = """You are an expert scientific document transcriber and editor.
+        load_s3_client().delete_object(Bucket=st.secrets["OCR_UPLOAD_BUCKET"], Key=key)
+    except Exception:
+        pass
+
+def groq_image_url(image_bytes, mime_type="image/jpeg"):
+    """Return (image_url, s3_key); s3_key is None when the image is sent inline"""
+    # Prefer a short-lived URL (no base64 overhead); fall back to an inline data URI
+    image_url, s3_key = upload_image_for_url(image_bytes, mime_type)
+    if image_url is None:
+        image_url = f"data:{mime_type};base64,{encode_image_bytes(image_bytes)}"
+    return image_url, s3_key
+
+# Groq system prompt, built once per transcription mode
+SYSTEM_PROMPT_BASE = """You are an expert scientific document transcriber and editor.
 
 Your task is to convert handwritten chemistry notes from an image into clean, structured study notes.
 
@@ -143,51 +239,81 @@ OUTPUT FORMAT:
 - Do NOT include explanations about what you are doing.
 - Do NOT mention OCR, AI, or the model.
 - Output ONLY the final structured notes."""
+STRICT_SUFFIX = "\n\nSTRICT MODE: If any text is unclear, preserve it as written rather than guessing."
+RELAXED_SUFFIX = "\n\nRELAXED MODE: Minor spelling corrections are allowed only for standard chemistry terms."
+PROMPT_STRICT = SYSTEM_PROMPT_BASE + STRICT_SUFFIX
+PROMPT_RELAXED = SYSTEM_PROMPT_BASE + RELAXED_SUFFIX
+
+# Shared across requests; only the image part is built per call
+USER_TEXT_PART = {"type": "text", "text": "Transcribe and structure the handwritten chemistry notes in this image according to the system instructions."}
+
+def build_groq_request(image_url, mode="Relaxed (Clean Notes)"):
+    """Build the chat completion arguments for a Groq call"""
+    system_prompt = PROMPT_STRICT if "Strict" in mode else PROMPT_RELAXED
+    image_part = {"type": "image_url", "image_url": {"url": image_url}}
+
+    return dict(
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": [USER_TEXT_PART, image_part]},
+        ],
+        model="meta-llama/llama-4-maverick-17b-128e-instruct",
+        temperature=0.2, # Added reliability constraint
+    )
 
-        # Add Mode Logic
-        if "Strict" in mode:
-            system_prompt += "\n\nSTRICT MODE: If any text is unclear, preserve it as written rather than guessing."
-        else:
-            system_prompt += "\n\nRELAXED MODE: Minor spelling corrections are allowed only for standard chemistry terms."
-
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Transcribe and structure the handwritten chemistry notes in this image according to the system instructions."},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            model="meta-llama/llama-4-maverick-17b-128e-instruct",
-            temperature=0.2, # Added reliability constraint
-        )
+def groq_ocr_process(image_bytes, api_key, mode="Relaxed (Clean Notes)", blocking=True, mime_type="image/jpeg"):
+    """Process image with Groq Llama 4 Maverick using improved system prompt"""
+    s3_key = None
+    try:
+        client = load_groq_client(api_key)
+        image_url, s3_key = groq_image_url(image_bytes, mime_type)
+        request = build_groq_request(image_url, mode)
+        chat_completion = call_with_retries(lambda: client.chat.completions.create(**request), blocking)
         return chat_completion.choices[0].message.content
     except Exception as e:
-        st.error(f"Groq Error: {e}")
-        return None
-
-def preprocess_image(image_path):
-    """Enhanced preprocessing for better OCR"""
-    img = cv2.imread(image_path)
+        raise OCRFailedError(f"Groq Error: {e}") from e
+    finally:
+        if s3_key:
+            delete_uploaded_image(s3_key)
+
+MAX_OCR_SIDE = 2048
+
+def downscale_for_ocr(img, max_side=MAX_OCR_SIDE):
+    """Shrink images whose longest side exceeds max_side; the vision models rescale anyway"""
+    h, w = img.shape[:2]
+    if max(h, w) <= max_side:
+        return img
+    scale = max_side / max(h, w)
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def decode_image(image_bytes: bytes):
+    # Decode straight from memory; returns None for unreadable images
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+def preprocess_image(image_bytes: bytes):
+    """Optional cleanup for faint or noisy photos.
+
+    Vision LLMs handle colour input well, so binarization can hurt accuracy on
+    clean photos; this is only applied when enabled in the sidebar.
+    """
+    img = decode_image(image_bytes)
     if img is None:
         return None
     
+    # Downscale first so thresholding runs on (and its output is) the final size
+    img = downscale_for_ocr(img)
+    
+    # Upscale small images so thin strokes survive thresholding, within MAX_OCR_SIDE
+    h, w = img.shape[:2]
+    scale = min(1024 / w, MAX_OCR_SIDE / max(h, w))
+    if scale > 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    
     # Convert to grayscale
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
-    # Remove noise
-    denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+    # Remove noise (Gaussian blur is far cheaper than NL-means denoising)
+    denoised = cv2.GaussianBlur(gray, (3, 3), 0)
     
     # Adaptive threshold
     thresh = cv2.adaptiveThreshold(
@@ -198,13 +324,7 @@ def preprocess_image(image_path):
     
     return thresh
 
-def gemini_ocr_process(image_path, api_key):
-    """Process image with Gemini Vision API"""
-    try:
-        model = load_gemini(api_key)
-        img = Image.open(image_path)
-        
-        prompt = """You are an expert transcriber for handwritten chemistry notes.
+GEMINI_PROMPT = """You are an expert transcriber for handwritten chemistry notes.
 
 Please transcribe this handwritten chemistry note into clean, structured Markdown format.
 
@@ -218,45 +338,111 @@ Follow these rules:
 
 Output ONLY the Markdown text, no additional commentary."""
 
-        response = model.generate_content([prompt, img])
+# Inline image data must stay under Gemini's 20 MB request limit
+GEMINI_INLINE_LIMIT = 16 * 1024 * 1024
+
+def build_gemini_content(image_bytes, mime_type="image/jpeg"):
+    """Build the prompt + image content for a Gemini call.
+
+    Returns (content, uploaded_file); uploaded_file is None unless the File API
+    was used, in which case the caller deletes it when done.
+    """
+    uploaded_file = None
+    if len(image_bytes) > GEMINI_INLINE_LIMIT:
+        # Large images go through the File API instead of inline data
+        import google.generativeai as genai
+        img = uploaded_file = genai.upload_file(io.BytesIO(image_bytes), mime_type=mime_type)
+    else:
+        # Send the encoded bytes as-is; no need to decode them locally
+        img = {"mime_type": mime_type, "data": image_bytes}
+    
+    return [GEMINI_PROMPT, img], uploaded_file
+
+def delete_gemini_file(uploaded_file):
+    # Best effort: Gemini also expires File API uploads after 48 hours
+    try:
+        import google.generativeai as genai
+        genai.delete_file(uploaded_file.name)
+    except Exception:
+        pass
+
+def gemini_ocr_process(image_bytes, api_key, mime_type="image/jpeg", blocking=True):
+    """Process image with Gemini Vision API"""
+    uploaded_file = None
+    try:
+        model = load_gemini(api_key)
+        content, uploaded_file = build_gemini_content(image_bytes, mime_type)
+        response = call_with_retries(lambda: model.generate_content(content, request_options=GEMINI_REQUEST_OPTIONS), blocking)
         return response.text
     except Exception as e:
-        st.error(f"Gemini Error: {e}")
-        return None
+        raise OCRFailedError(f"Gemini Error: {e}") from e
+    finally:
+        if uploaded_file is not None:
+            delete_gemini_file(uploaded_file)
 
-def create_structured_docx(ocr_result, image_path, engine_type="groq"):
-    """Create a structured Word document from OCR results"""
-    doc = Document()
-    
+def image_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def cached_ocr(image_key, engine_type, mode, mime_type, enhance, api_key_fingerprint, _raw, _api_key, _blocking=True):
+    """Run OCR once per (upload hash, engine, mode, preprocessing, key).
+
+    Underscored arguments are not hashed; the upload is identified by image_key.
+    """
+    # Preparing (decode, resize, re-encode) happens here so cache hits skip it
+    ocr_bytes, ocr_mime = prepare_ocr_image(_raw, mime_type, enhance)
+    if engine_type == "groq":
+        return groq_ocr_process(ocr_bytes, _api_key, mode, _blocking, ocr_mime)
+    return gemini_ocr_process(ocr_bytes, _api_key, ocr_mime, _blocking)
+
+def run_ocr(raw, engine_type, api_key, mode=None, mime_type="image/jpeg", enhance=False, blocking=True):
+    """OCR an uploaded image, reusing the cached result for identical content and settings.
+
+    Raises OCRFailedError on failure.
+    """
+    return cached_ocr(image_hash(raw), engine_type, mode, mime_type, enhance, image_hash(api_key.encode()), raw, api_key, blocking)
+
+MARKDOWN_LINE_RE = re.compile(r'^(#{1,3} |[-*] |\[DIAGRAM)')
+
+@st.cache_resource
+def docx_template_bytes():
+    # Serialize the default template once instead of loading it from disk per document
+    buf = io.BytesIO()
+    Document().save(buf)
+    return buf.getvalue()
+
+def new_document():
+    return Document(io.BytesIO(docx_template_bytes()))
+
+def add_docx_header(doc, engine_type):
     # Title
     title = doc.add_heading("Chemistry Notes - OCR Extraction", level=1)
     title.alignment = WD_ALIGN_PARAGRAPH.CENTER
     
     doc.add_paragraph(f"OCR Engine: {engine_type.upper()}")
     doc.add_paragraph("_" * 50)
-    
+
+def add_docx_page(doc, ocr_result, image, engine_type):
     if engine_type in ["groq", "gemini"]:
         # Markdown output - convert to Word
         if ocr_result:
-            lines = ocr_result.split('\n')
-            for line in lines:
-                line = line.strip()
+            bullet_style = doc.styles['List Bullet']
+            quote_style = doc.styles['Intense Quote']
+            for line in (l.strip() for l in ocr_result.split('\n')):
                 if not line:
                     continue
-                    
-                # Detect markdown headings
-                if line.startswith('### '):
-                    doc.add_heading(line[4:], level=3)
-                elif line.startswith('## '):
-                    doc.add_heading(line[3:], level=2)
-                elif line.startswith('# '):
-                    doc.add_heading(line[2:], level=1)
-                elif line.startswith('- ') or line.startswith('* '):
-                    doc.add_paragraph(line[2:], style='List Bullet')
-                elif line.startswith('[DIAGRAM'):
-                    doc.add_paragraph(line, style='Intense Quote')
-                else:
+                
+                # Detect markdown headings, bullets and diagram placeholders
+                m = MARKDOWN_LINE_RE.match(line)
+                marker = m.group(1) if m else None
+                if marker is None:
                     doc.add_paragraph(line)
+                elif marker[0] == '#':
+                    doc.add_heading(line[len(marker):], level=len(marker) - 1)
+                elif marker == '[DIAGRAM':
+                    doc.add_paragraph(line, style=quote_style)
+                else:
+                    doc.add_paragraph(line[2:], style=bullet_style)
     
     # Add separator
     doc.add_paragraph()
@@ -265,27 +451,125 @@ def create_structured_docx(ocr_result, image_path, engine_type="groq"):
     # Add original image at the end for reference
     doc.add_heading("Original Image (Reference)", level=2)
     try:
-        doc.add_picture(image_path, width=Inches(6))
+        doc.add_picture(image, width=Inches(6))
     except:
         doc.add_paragraph("[Could not embed original image]")
-    
+
+def create_structured_docx(ocr_result, image, engine_type="groq"):
+    """Create a structured Word document from OCR results"""
+    doc = new_document()
+    add_docx_header(doc, engine_type)
+    add_docx_page(doc, ocr_result, image, engine_type)
     return doc
 
+def create_batch_docx(pages, engine_type="groq"):
+    """Create one Word document from (name, ocr_result, image) pages, a page break between each"""
+    doc = new_document()
+    add_docx_header(doc, engine_type)
+    for i, (name, ocr_result, image) in enumerate(pages):
+        if i:
+            doc.add_page_break()
+        doc.add_heading(name, level=2)
+        add_docx_page(doc, ocr_result, image, engine_type)
+    return doc
+
+def prepare_ocr_image(raw, mime_type, enhance=False):
+    """Return the (bytes, mime type) sent to OCR.
+
+    This is the original upload unless it is too large (downscaled to cut the
+    payload) or preprocessing is enabled.
+    """
+    if enhance:
+        # preprocess_image downscales before thresholding
+        img = preprocess_image(raw)
+        if img is None:
+            return raw, mime_type
+    else:
+        decoded = decode_image(raw)
+        if decoded is None:
+            return raw, mime_type
+        img = downscale_for_ocr(decoded)
+        if img is decoded:
+            return raw, mime_type
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes(), "image/jpeg"
+
+def submit_with_ctx(fn, *args):
+    """Run fn on a short-lived thread with this session's Streamlit context attached.
+
+    fn should not render anything: the thread is outside the caller's layout
+    containers, so results and errors are returned through the future instead.
+    The thread exits (dropping its reference to the session) once fn returns.
+    """
+    future = Future()
+    def task():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    thread = threading.Thread(target=task, daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    return future
+
+def ocr_result_or_error(future):
+    """Wait for a submitted OCR call, showing its error in the current container"""
+    try:
+        return future.result()
+    except OCRFailedError as e:
+        st.error(str(e))
+        return None
+
+async def ocr_many(uploads, engine_type, api_key, mode=None, enhance=False, max_concurrency=4, blocking=True, on_progress=None):
+    """OCR several (raw_bytes, mime_type) uploads concurrently through the shared OCR cache.
+
+    Returns (result, error) pairs in input order; on_progress(done, total) is
+    called as each upload finishes.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(index, raw, mime_type):
+        async with semaphore:
+            future = submit_with_ctx(run_ocr, raw, engine_type, api_key, mode, mime_type, enhance, blocking)
+            try:
+                return index, await asyncio.wrap_future(future), None
+            except OCRFailedError as e:
+                return index, None, str(e)
+    
+    results = [(None, None)] * len(uploads)
+    tasks = [run(i, raw, mime) for i, (raw, mime) in enumerate(uploads)]
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        index, result, error = await task
+        results[index] = (result, error)
+        if on_progress:
+            on_progress(done, len(uploads))
+    return results
+
 
 # Main app
-uploaded_file = st.file_uploader("📤 Upload handwritten note", type=["jpg", "jpeg", "png"])
+uploaded_files = st.file_uploader(
+    "📤 Upload handwritten notes",
+    type=["jpg", "jpeg", "png"],
+    accept_multiple_files=True,
+    help="Upload several pages to process them concurrently into one document."
+)
+doc = None
 
-if uploaded_file:
+if uploaded_files and len(uploaded_files) == 1:
+    uploaded_file = uploaded_files[0]
     col1, col2 = st.columns([1, 1])
     
-    # Save uploaded file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-        tmp.write(uploaded_file.read())
-        input_path = tmp.name
+    # Work from the in-memory upload; no temp file is needed
+    raw = uploaded_file.getvalue()
+    
+    # Start OCR in the background so the API round-trip overlaps with rendering the preview
+    if ocr_engine == "Groq (Llama 4 Maverick)" and groq_api_key:
+        future = submit_with_ctx(run_ocr, raw, "groq", groq_api_key, transcription_mode, uploaded_file.type, enhance_image, retry_blocking)
+    elif ocr_engine == "Gemini AI (Best Quality)" and gemini_api_key:
+        future = submit_with_ctx(run_ocr, raw, "gemini", gemini_api_key, None, uploaded_file.type, enhance_image, retry_blocking)
     
     with col1:
         st.subheader("📸 Original Image")
-        st.image(input_path, use_container_width=True)
+        st.image(raw, use_container_width=True)
     
     with col2:
         st.subheader("📝 Extracted Content")
@@ -293,52 +577,77 @@ if uploaded_file:
         if ocr_engine == "Groq (Llama 4 Maverick)":
             if groq_api_key:
                 with st.spinner('⚡ Groq (Llama 4 Maverick) is analyzing your note...'):
-                    ocr_result = groq_ocr_process(input_path, groq_api_key, transcription_mode)
+                    ocr_result = ocr_result_or_error(future)
                     
                     if ocr_result:
                         st.markdown(ocr_result)
-                        doc = create_structured_docx(ocr_result, input_path, engine_type="groq")
+                        doc = create_structured_docx(ocr_result, io.BytesIO(raw), engine_type="groq")
                     else:
                         st.error("Failed to process with Groq. Check API Key or try again.")
-                        doc = None
             else:
                 st.warning("⚠️ Please enter your Groq API key in the sidebar")
-                doc = None
             
         else:  # Gemini
             if gemini_api_key:
                 with st.spinner('🤖 Gemini AI is analyzing your note...'):
-                    ocr_result = gemini_ocr_process(input_path, gemini_api_key)
+                    ocr_result = ocr_result_or_error(future)
                     
                     if ocr_result:
                         st.markdown(ocr_result)
-                        doc = create_structured_docx(ocr_result, input_path, engine_type="gemini")
+                        doc = create_structured_docx(ocr_result, io.BytesIO(raw), engine_type="gemini")
                     else:
                         st.error("Failed to process with Gemini")
-                        doc = None
             else:
                 st.warning("⚠️ Please enter your Gemini API key in the sidebar")
-                doc = None
+
+elif uploaded_files:
+    # Batch mode: OCR all pages concurrently
+    if ocr_engine == "Groq (Llama 4 Maverick)":
+        engine_type, engine_name, api_key, mode = "groq", "Groq", groq_api_key, transcription_mode
+    else:
+        engine_type, engine_name, api_key, mode = "gemini", "Gemini", gemini_api_key, None
     
-    # Download button
-    if 'doc' in locals() and doc is not None:
-        doc_path = "chemistry_notes_ocr.docx"
-        doc.save(doc_path)
+    if api_key:
+        raws = [f.getvalue() for f in uploaded_files]
+        uploads = [(raw, f.type) for raw, f in zip(raws, uploaded_files)]
         
-        with open(doc_path, "rb") as f:
-            st.download_button(
-                label="⬇️ Download Structured Word Document",
-                data=f,
-                file_name="chemistry_notes_structured.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                use_container_width=True
-            )
+        # Pages go through the same cache as single uploads, so reruns only call the API for new pages
+        progress = st.progress(0.0, text=f"Processing {len(uploads)} pages with {engine_name}...")
+        def on_progress(done, total):
+            progress.progress(done / total, text=f"Processed {done}/{total} pages")
         
-        # Cleanup
-        try:
-            os.remove(input_path)
-        except:
-            pass
+        results = asyncio.run(ocr_many(uploads, engine_type, api_key, mode, enhance_image, blocking=retry_blocking, on_progress=on_progress))
+        
+        pages = []
+        for f, raw, (ocr_result, error) in zip(uploaded_files, raws, results):
+            with st.expander(f"📄 {f.name}", expanded=ocr_result is None):
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    st.image(raw, use_container_width=True)
+                with col2:
+                    if ocr_result:
+                        st.markdown(ocr_result)
+                        pages.append((f.name, ocr_result, io.BytesIO(raw)))
+                    else:
+                        st.error(error or f"Failed to process with {engine_name}")
+        
+        if pages:
+            doc = create_batch_docx(pages, engine_type)
+    else:
+        st.warning(f"⚠️ Please enter your {engine_name} API key in the sidebar")
+
+# Download button
+if doc is not None:
+    buf = io.BytesIO()
+    doc.save(buf)
+    
+    st.download_button(
+        label="⬇️ Download Structured Word Document",
+        data=buf.getvalue(),
+        file_name="chemistry_notes_structured.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        use_container_width=True
+    )
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("""